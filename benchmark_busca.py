@@ -0,0 +1,77 @@
+"""
+Mede a latência de `GET /produto/search` em um catálogo grande, no banco
+configurado em SQLALCHEMY_DATABASE_URL:
+
+    python benchmark_busca.py --produtos 1000000
+    python benchmark_busca.py --limpar
+
+Os produtos gerados têm id com o prefixo `bench-` e só são inseridos até
+completar a quantidade pedida, então execuções seguintes reaproveitam o
+catálogo. `--limpar` remove esses produtos.
+"""
+import argparse
+import random
+import statistics
+import time
+from sqlalchemy import func, select
+
+from routes.database import SessionLocal, engine
+from routes.models import Produto
+from routes.produto import search
+
+PALAVRAS = [
+    "camisa", "camiseta", "bermuda", "calca", "jaqueta", "tenis", "meia", "bone",
+    "coxa", "azul", "preta", "branca", "verde", "oficial", "retro", "infantil",
+    "de", "com", "algodao", "poliester", "p", "m", "g", "gg", "kit", "treino",
+]
+CONSULTAS = ["camisa", "cam", "camisa azul", "camisa de", "coxa retro", "kit treino gg", "inexistente"]
+PREFIXO = "bench-"
+LOTE = 10000
+
+def popular(quantidade: int):
+    with engine.begin() as conn:
+        inicio = conn.execute(
+            select(func.count()).select_from(Produto.__table__).where(Produto.id_produto.like(f"{PREFIXO}%"))
+        ).scalar()
+    aleatorio = random.Random(inicio)
+    for lote in range(inicio, quantidade, LOTE):
+        linhas = [{
+            "id_produto": f"{PREFIXO}{n}",
+            "nome": " ".join(aleatorio.choices(PALAVRAS, k=aleatorio.randint(2, 4)))[:36],
+            "peso": round(aleatorio.uniform(0.1, 5), 2),
+            "preco": round(aleatorio.uniform(5, 500), 2),
+        } for n in range(lote, min(lote + LOTE, quantidade))]
+        with engine.begin() as conn:
+            conn.execute(Produto.__table__.insert(), linhas)
+        print(f"{lote + len(linhas)} produtos", end="\r")
+    print()
+
+def medir(repeticoes: int):
+    db = SessionLocal()
+    try:
+        for q in CONSULTAS:
+            tempos = []
+            for _ in range(repeticoes):
+                antes = time.perf_counter()
+                search(q=q, preco_min=None, preco_max=None, peso_min=None, peso_max=None,
+                       limit=50, offset=0, db=db)
+                tempos.append((time.perf_counter() - antes) * 1000)
+            tempos.sort()
+            print(f"{q!r:20} p50={statistics.median(tempos):8.2f} ms  "
+                  f"p95={tempos[int(len(tempos) * 0.95) - 1]:8.2f} ms")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--produtos", type=int, default=1000000, help="Tamanho do catálogo.")
+    parser.add_argument("--repeticoes", type=int, default=20, help="Execuções de cada consulta.")
+    parser.add_argument("--limpar", action="store_true", help="Remove os produtos gerados e sai.")
+    args = parser.parse_args()
+
+    if args.limpar:
+        with engine.begin() as conn:
+            conn.execute(Produto.__table__.delete().where(Produto.id_produto.like(f"{PREFIXO}%")))
+    else:
+        popular(args.produtos)
+        medir(args.repeticoes)
@@ -1,5 +1,5 @@
 from fastapi import FastAPI
-from routes import encomenda ,produto, usuario, localizacao
+from routes import encomenda ,produto, usuario, localizacao, relatorio
 
 
 
@@ -10,4 +10,5 @@ app.include_router(encomenda.router)
 app.include_router(localizacao.router)
 app.include_router(produto.router)
 app.include_router(usuario.router)
+app.include_router(relatorio.router)
 
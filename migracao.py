@@ -0,0 +1,173 @@
+"""
+Migra um banco criado antes das mudanças de esquema que `create_all` não
+aplica em tabelas existentes e preenche os consolidados de vendas e eventos.
+Rodar uma vez, com a API parada:
+
+    python migracao.py
+
+Cada passo verifica o esquema atual e não faz nada se já tiver sido aplicado.
+"""
+import uuid
+from sqlalchemy import inspect, select, text, union
+from sqlalchemy.schema import AddConstraint
+
+from routes.database import engine
+from routes.endereco import normalizar_endereco
+from routes.models import Base, Encomenda, Localizacao, Endereco
+from routes.relatorio import semear_consolidados
+
+# Índices substituídos por outros em `routes.models`, removidos depois que os
+# novos são criados.
+INDICES_OBSOLETOS = [
+    ("encomendas", "ix_encomendas_comprador_data"),
+    ("encomendas", "ix_encomendas_vendedor_data"),
+    ("encomendas", "ix_encomendas_id_endereco_origem"),
+    ("encomendas", "ix_encomendas_id_endereco_destino"),
+    ("localizacoes", "ix_localizacoes_endereco_data"),
+]
+
+# Colunas de texto antigas -> coluna com o id do endereço.
+COLUNAS_ENDERECO = [
+    (Encomenda.__table__, "endereco_origem", "id_endereco_origem"),
+    (Encomenda.__table__, "endereco_destino", "id_endereco_destino"),
+    (Localizacao.__table__, "endereco", "id_endereco"),
+]
+
+def _colunas(conn, tabela):
+    return {coluna["name"] for coluna in inspect(conn).get_columns(tabela.name)}
+
+def _criar_indices_e_fks(conn, tabela, colunas):
+    """
+    Cria os índices e as chaves estrangeiras de `tabela` que envolvem
+    `colunas`, conforme declarados em `routes.models`.
+    """
+    existentes = {indice["name"] for indice in inspect(conn).get_indexes(tabela.name)}
+    atuais = _colunas(conn, tabela)
+    for indice in tabela.indexes:
+        nomes = {coluna.name for coluna in indice.columns}
+        # Índices com colunas de passos seguintes ficam para `criar_indices_faltantes`.
+        if indice.name not in existentes and nomes & colunas and nomes <= atuais:
+            indice.create(conn)
+    # SQLite não suporta ALTER TABLE ... ADD CONSTRAINT.
+    if conn.dialect.name != "sqlite":
+        for fk in tabela.foreign_keys:
+            if fk.parent.name in colunas:
+                conn.execute(AddConstraint(fk.constraint))
+
+def _binario(conn, expressao: str) -> str:
+    # A collation padrão do MySQL ignora acentos e maiúsculas; aqui textos só
+    # são iguais se forem idênticos, e a equivalência vem de `normalizar_endereco`.
+    if conn.dialect.name == "mysql":
+        return f"CONVERT({expressao} USING utf8mb4) COLLATE utf8mb4_bin"
+    return expressao
+
+def migrar_chave_enderecos(conn):
+    """
+    No MySQL, garante a collation binária de `enderecos.chave` em tabelas
+    criadas antes de ela ser declarada no modelo.
+    """
+    if conn.dialect.name != "mysql" or not inspect(conn).has_table("enderecos"):
+        return
+    for coluna in inspect(conn).get_columns("enderecos"):
+        if coluna["name"] == "chave" and getattr(coluna["type"], "collation", None) != "utf8mb4_bin":
+            conn.execute(text("ALTER TABLE enderecos MODIFY chave VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin"))
+
+def migrar_enderecos(conn):
+    """
+    Troca as colunas de texto `encomendas.endereco_origem`,
+    `encomendas.endereco_destino` e `localizacoes.endereco` por ids da tabela
+    `enderecos`, cadastrando cada endereço distinto uma única vez.
+    """
+    pendentes = [(tabela, antiga, nova) for tabela, antiga, nova in COLUNAS_ENDERECO
+                 if antiga in _colunas(conn, tabela)]
+    if not pendentes:
+        return
+
+    Endereco.__table__.create(conn, checkfirst=True)
+    for tabela, antiga, nova in pendentes:
+        if nova not in _colunas(conn, tabela):
+            conn.execute(text(f"ALTER TABLE {tabela.name} ADD COLUMN {nova} VARCHAR(36)"))
+
+    # Endereços distintos (poucos, em relação às linhas) -> id do endereço.
+    ids = {row.chave: row.id_endereco for row in conn.execute(select(Endereco.chave, Endereco.id_endereco))}
+    textos = union(*[select(text(f"{_binario(conn, antiga)} AS texto")).select_from(tabela)
+                     .where(text(f"{antiga} IS NOT NULL"))
+                     for tabela, antiga, _ in pendentes])
+    mapa = []
+    for (texto,) in conn.execute(textos):
+        chave = normalizar_endereco(texto)
+        if chave not in ids:
+            ids[chave] = str(uuid.uuid4())
+            conn.execute(Endereco.__table__.insert().values(
+                id_endereco=ids[chave], chave=chave, endereco=" ".join(texto.split())
+            ))
+        mapa.append({"texto": texto, "id_endereco": ids[chave]})
+
+    tipo_texto = "VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin" if conn.dialect.name == "mysql" else "VARCHAR(255)"
+    conn.execute(text(f"CREATE TABLE migracao_enderecos (texto {tipo_texto}, id_endereco VARCHAR(36))"))
+    conn.execute(text("CREATE INDEX ix_migracao_enderecos_texto ON migracao_enderecos (texto)"))
+    if mapa:
+        conn.execute(text("INSERT INTO migracao_enderecos (texto, id_endereco) VALUES (:texto, :id_endereco)"), mapa)
+    for tabela, antiga, nova in pendentes:
+        conn.execute(text(
+            f"UPDATE {tabela.name} SET {nova} = (SELECT MIN(m.id_endereco) FROM migracao_enderecos m "
+            f"WHERE m.texto = {_binario(conn, f'{tabela.name}.{antiga}')}) WHERE {antiga} IS NOT NULL"
+        ))
+    conn.execute(text("DROP TABLE migracao_enderecos"))
+
+    for tabela, antiga, nova in pendentes:
+        conn.execute(text(f"ALTER TABLE {tabela.name} DROP COLUMN {antiga}"))
+    for tabela in {tabela for tabela, _, _ in pendentes}:
+        _criar_indices_e_fks(conn, tabela, {nova for t, _, nova in pendentes if t is tabela})
+
+def migrar_remocao_logica(conn):
+    """
+    Adiciona `encomendas.removido_em` e recria a chave estrangeira
+    `localizacoes.id_encomenda` com ON DELETE CASCADE.
+    """
+    if "removido_em" not in _colunas(conn, Encomenda.__table__):
+        tipo = Encomenda.__table__.c.removido_em.type.compile(conn.dialect)
+        conn.execute(text(f"ALTER TABLE encomendas ADD COLUMN removido_em {tipo}"))
+
+    # SQLite não altera chaves estrangeiras existentes; lá a tabela precisa ser recriada.
+    if conn.dialect.name == "sqlite":
+        return
+    for fk in inspect(conn).get_foreign_keys("localizacoes"):
+        if fk["constrained_columns"] == ["id_encomenda"] and fk["options"].get("ondelete", "").upper() != "CASCADE":
+            comando = "DROP FOREIGN KEY" if conn.dialect.name == "mysql" else "DROP CONSTRAINT"
+            conn.execute(text(f"ALTER TABLE localizacoes {comando} {fk['name']}"))
+            conn.execute(AddConstraint(next(iter(Localizacao.__table__.c.id_encomenda.foreign_keys)).constraint))
+
+def criar_indices_faltantes(conn):
+    """
+    Cria os índices declarados em `routes.models` que ainda não existem nas
+    tabelas (por exemplo os de busca de produtos e de histórico por usuário).
+    """
+    for tabela in Base.metadata.sorted_tables:
+        existentes = {indice["name"] for indice in inspect(conn).get_indexes(tabela.name)}
+        colunas = _colunas(conn, tabela)
+        for indice in tabela.indexes:
+            if indice.name not in existentes and {coluna.name for coluna in indice.columns} <= colunas:
+                indice.create(conn)
+
+def remover_indices_obsoletos(conn):
+    """
+    Remove os índices de `INDICES_OBSOLETOS` que ainda existirem.
+    """
+    for tabela, nome in INDICES_OBSOLETOS:
+        if nome in {indice["name"] for indice in inspect(conn).get_indexes(tabela)}:
+            comando = f"DROP INDEX {nome} ON {tabela}" if conn.dialect.name == "mysql" else f"DROP INDEX {nome}"
+            conn.execute(text(comando))
+
+if __name__ == "__main__":
+    with engine.begin() as conn:
+        migrar_chave_enderecos(conn)
+        migrar_enderecos(conn)
+        migrar_remocao_logica(conn)
+        Base.metadata.create_all(conn)
+        criar_indices_faltantes(conn)
+        remover_indices_obsoletos(conn)
+    # Em processo único, antes da API subir: vários workers semeando ao
+    # mesmo tempo disputariam o DELETE/INSERT dos consolidados.
+    semear_consolidados()
+    print("Migração concluída.")
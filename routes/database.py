@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.exc import OperationalError
 from dotenv import load_dotenv
 from sqlalchemy.ext.declarative import declarative_base
@@ -9,6 +9,9 @@ load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("SQLALCHEMY_DATABASE_URL")
 
+# Quantidade de linhas removidas por transação nas remoções em lote.
+TAMANHO_LOTE = 1000
+
 def create_database(url):
     db_name = url.rsplit('/', 1)[-1]
     engine = create_engine(url.rsplit('/', 1)[0])
@@ -17,8 +20,18 @@ def create_database(url):
         conn.execute(text(f"CREATE DATABASE IF NOT EXISTS {db_name}"))
         print(f"Database '{db_name}' created or already exists.")
 
+engine = create_engine(SQLALCHEMY_DATABASE_URL)
+
+# O SQLite só aplica chaves estrangeiras (e o ON DELETE CASCADE de
+# `localizacoes` e `encomenda_produto`) se isso for ligado em cada conexão.
+@event.listens_for(engine, "connect")
+def _ligar_chaves_estrangeiras(dbapi_connection, connection_record):
+    if engine.dialect.name == "sqlite":
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
 try:
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
     conn = engine.connect()
     conn.close()
     print("Connected to the database successfully.")
@@ -4,10 +4,13 @@ from uuid import uuid4
 from sqlalchemy import create_engine, Column, String
 from datetime import datetime
 from . import models
-from .database import SessionLocal, engine
+from .database import SessionLocal, engine, TAMANHO_LOTE
 from sqlalchemy.orm import Session as ORM_Session
-from typing import List
+from typing import List, Optional
+from collections import Counter, defaultdict
 from . models import Produto, Encomenda, LocalizacaoOut, Localizacao
+from .relatorio import registrar_venda, ajustar_venda, ajustar_eventos
+from .endereco import resolver_endereco, esquecer_enderecos
 import requests
 router = APIRouter(
     prefix="/encomenda",
@@ -24,6 +27,8 @@ class EncomendaOut(BaseModel):
     id_usuario_comprador: str
     id_usuario_vendedor: str
 
+    class Config:
+        from_attributes = True
 
 
 class EncomendaIn(BaseModel):
@@ -33,6 +38,11 @@ class EncomendaIn(BaseModel):
     id_usuario_comprador: str = Field(..., description="ID do usuário comprador.")
     id_usuario_vendedor: str = Field(..., description="ID do usuário vendedor.")
 
+class EncomendaRemocaoIn(BaseModel):
+    ids: Optional[List[str]] = Field(None, description="IDs das encomendas a remover.")
+    antes_de: Optional[datetime] = Field(None, description="Remove as encomendas postadas antes desta data.")
+    logica: bool = Field(False, description="Apenas marca as encomendas como removidas, sem excluí-las.")
+
 def get_db():
     db = SessionLocal()
     try:
@@ -64,6 +74,56 @@ def get_db():
     finally:
         db.close()
 
+def _vendas_do_lote(db: ORM_Session, ids: List[str]) -> dict:
+    # Encomendas já removidas logicamente foram descontadas na remoção lógica.
+    vendas = defaultdict(lambda: [0, 0.0, 0.0])
+    for row in db.query(Encomenda.id_usuario_vendedor, Encomenda.data_postagem, Encomenda.valor_total, Encomenda.peso_total) \
+            .filter(Encomenda.id_encomenda.in_(ids), Encomenda.removido_em.is_(None), Encomenda.id_usuario_vendedor.isnot(None)):
+        venda = vendas[(row.id_usuario_vendedor, row.data_postagem.date())]
+        venda[0] += 1
+        venda[1] += row.valor_total or 0
+        venda[2] += row.peso_total or 0
+    return vendas
+
+def _descontar_vendas(db: ORM_Session, vendas: dict):
+    # Ordem fixa para que lotes concorrentes bloqueiem as linhas na mesma ordem.
+    for (id_usuario_vendedor, dia), (quantidade, valor, peso) in sorted(vendas.items()):
+        ajustar_venda(db, id_usuario_vendedor, dia, -quantidade, -valor, -peso)
+
+def _excluir_lote(db: ORM_Session, ids: List[str]):
+    """
+    Exclui as encomendas sem carregá-las. `encomenda_produto` e
+    `localizacoes` são removidas pelo ON DELETE CASCADE do banco.
+    """
+    vendas = _vendas_do_lote(db, ids)
+    eventos = Counter(row.data.date() for row in db.query(Localizacao.data).filter(Localizacao.id_encomenda.in_(ids)))
+    db.query(Encomenda).filter(Encomenda.id_encomenda.in_(ids)).delete(synchronize_session=False)
+    _descontar_vendas(db, vendas)
+    for dia, quantidade in sorted(eventos.items()):
+        ajustar_eventos(db, dia, -quantidade)
+
+def _desativar_lote(db: ORM_Session, ids: List[str]):
+    vendas = _vendas_do_lote(db, ids)
+    db.query(Encomenda).filter(Encomenda.id_encomenda.in_(ids)) \
+        .update({Encomenda.removido_em: datetime.now()}, synchronize_session=False)
+    _descontar_vendas(db, vendas)
+
+def _remover_encomendas(db: ORM_Session, filtros: list, logica: bool) -> int:
+    total = 0
+    while True:
+        query = db.query(Encomenda.id_encomenda).filter(*filtros)
+        if logica:
+            query = query.filter(Encomenda.removido_em.is_(None))
+        lote = [row.id_encomenda for row in query.limit(TAMANHO_LOTE)]
+        if not lote:
+            return total
+        if logica:
+            _desativar_lote(db, lote)
+        else:
+            _excluir_lote(db, lote)
+        db.commit()
+        total += len(lote)
+
 @router.post("/", response_model=EncomendaOut, summary="Criar Encomenda")    
 def create_encomenda(encomendaIn: EncomendaIn = Body(
         ...,
@@ -79,8 +139,8 @@ def create_encomenda(encomendaIn: EncomendaIn = Body(
     try:
 
         encomenda = Encomenda(
-            endereco_origem=encomendaIn.endereco_origem,
-            endereco_destino=encomendaIn.endereco_destino,
+            id_endereco_origem=resolver_endereco(db, encomendaIn.endereco_origem),
+            id_endereco_destino=resolver_endereco(db, encomendaIn.endereco_destino),
             id_usuario_comprador=encomendaIn.id_usuario_comprador,
             id_usuario_vendedor=encomendaIn.id_usuario_vendedor
         )
@@ -99,6 +159,8 @@ def create_encomenda(encomendaIn: EncomendaIn = Body(
         encomenda.valor_total = valor_total
         encomenda.peso_total = peso_total
         db.add(encomenda)
+        db.flush()
+        registrar_venda(db, encomenda)
         db.commit()
         db.refresh(encomenda)
         
@@ -117,15 +179,16 @@ def create_encomenda(encomendaIn: EncomendaIn = Body(
         )
     except IntegrityError as e:
         db.rollback()
+        esquecer_enderecos(encomendaIn.endereco_origem, encomendaIn.endereco_destino)
         raise HTTPException(status_code=400, detail="Erro ao criar encomenda: {}".format(e))
 
-@router.get("/", summary="Listar Todas as Encomendas")
+@router.get("/", response_model=List[EncomendaOut], summary="Listar Todas as Encomendas")
 def get_encomendas(db: ORM_Session = Depends(get_db)):
-    return db.query(Encomenda).all()
+    return db.query(Encomenda).filter(Encomenda.removido_em.is_(None)).all()
 
-@router.get("/{id}", summary="Obter Encomenda")
+@router.get("/{id}", response_model=EncomendaOut, summary="Obter Encomenda")
 def get_encomenda(id: str = Path(..., description="ID da encomenda que deseja obter."), db: ORM_Session = Depends(get_db)):
-    encomenda = db.query(Encomenda).filter(Encomenda.id_encomenda == id).first()
+    encomenda = db.query(Encomenda).filter(Encomenda.id_encomenda == id, Encomenda.removido_em.is_(None)).first()
     if encomenda:
         return encomenda
     raise HTTPException(status_code=404, detail=f"Encomenda com id {id} não encontrada")
@@ -143,12 +206,17 @@ def update_encomenda(id: str = Path(..., description="ID da encomenda que deseja
                              "id_usuario_vendedor": "13cc3687-050a-4e0f-8f46-3fe63aa6e5db"
                          }
                      ), db: ORM_Session = Depends(get_db)):
-    encomenda = db.query(Encomenda).filter(Encomenda.id_encomenda == id).first()
+    encomenda = db.query(Encomenda).filter(Encomenda.id_encomenda == id, Encomenda.removido_em.is_(None)).first()
     if encomenda:
         try:
+            # Valores atuais, descontados do consolidado antes do commit
+            vendedor_anterior = encomenda.id_usuario_vendedor
+            valor_anterior = encomenda.valor_total or 0
+            peso_anterior = encomenda.peso_total or 0
+
             # Update basic attributes
-            encomenda.endereco_origem = encomendaIn.endereco_origem
-            encomenda.endereco_destino = encomendaIn.endereco_destino
+            encomenda.id_endereco_origem = resolver_endereco(db, encomendaIn.endereco_origem)
+            encomenda.id_endereco_destino = resolver_endereco(db, encomendaIn.endereco_destino)
             encomenda.id_usuario_comprador = encomendaIn.id_usuario_comprador
             encomenda.id_usuario_vendedor = encomendaIn.id_usuario_vendedor
 
@@ -167,6 +235,9 @@ def update_encomenda(id: str = Path(..., description="ID da encomenda que deseja
             
             encomenda.valor_total = valor_total
             encomenda.peso_total = peso_total
+            db.flush()
+            ajustar_venda(db, vendedor_anterior, encomenda.data_postagem.date(), -1, -valor_anterior, -peso_anterior)
+            registrar_venda(db, encomenda)
             
             db.commit()
             db.refresh(encomenda)
@@ -184,15 +255,60 @@ def update_encomenda(id: str = Path(..., description="ID da encomenda que deseja
             )
         except IntegrityError as e:
             db.rollback()
+            esquecer_enderecos(encomendaIn.endereco_origem, encomendaIn.endereco_destino)
             raise HTTPException(status_code=400, detail="Erro ao atualizar encomenda: {}".format(e))
     raise HTTPException(status_code=404, detail=f"Encomenda com id {id} não encontrada")
 
 
+@router.delete("/", summary="Deletar Encomendas em Lote")
+def delete_encomendas(remocao: EncomendaRemocaoIn = Body(
+        ...,
+        description="Encomendas a remover, por ID e/ou por data de postagem.",
+        example={
+            "antes_de": "2023-01-01T00:00:00",
+            "logica": False
+        }
+    ), db: ORM_Session = Depends(get_db)):
+    """
+    Remove encomendas em lote, com o histórico de localização delas.
+
+    As encomendas são removidas em lotes de `TAMANHO_LOTE`, uma transação por
+    lote. Com `logica` as encomendas são apenas marcadas como removidas (um
+    UPDATE, sem cascata), e podem ser excluídas depois fora do horário de pico
+    com uma nova chamada sem `logica`.
+
+    Parâmetros:
+    - `remocao`: IDs e/ou data limite das encomendas. Se ambos forem
+      informados, só são removidas as encomendas que atendem aos dois.
+        Exemplo:
+        ```
+        {
+            "ids": ["b2a53b2a-5151-4ef7-ae94-c4992dd119ef"],
+            "logica": true
+        }
+        ```
+    """
+    if not remocao.ids and remocao.antes_de is None:
+        raise HTTPException(status_code=400, detail="Informe ids ou antes_de")
+
+    filtros = []
+    if remocao.antes_de is not None:
+        filtros.append(Encomenda.data_postagem < remocao.antes_de)
+
+    total = 0
+    if remocao.ids:
+        for inicio in range(0, len(remocao.ids), TAMANHO_LOTE):
+            ids = remocao.ids[inicio:inicio + TAMANHO_LOTE]
+            total += _remover_encomendas(db, filtros + [Encomenda.id_encomenda.in_(ids)], remocao.logica)
+    else:
+        total = _remover_encomendas(db, filtros, remocao.logica)
+    return {"message": f"{total} encomendas removidas"}
+
 @router.delete("/{id}", summary="Deletar Encomenda")
 def delete_encomenda(id: str = Path(..., description="ID da encomenda que deseja deletar."), db: ORM_Session = Depends(get_db)):
-    encomenda = db.query(Encomenda).filter(Encomenda.id_encomenda == id).first()
+    encomenda = db.query(Encomenda.id_encomenda).filter(Encomenda.id_encomenda == id).first()
     if encomenda:
-        db.delete(encomenda)
+        _excluir_lote(db, [id])
         db.commit()
         return {"message": "Encomenda removida"}
     raise HTTPException(status_code=404, detail=f"Encomenda com id {id} não encontrada")
@@ -210,6 +326,8 @@ def get_status_encomenda(id: str = Path(..., description="ID da encomenda que de
         ```
 
     """
+    if not db.query(Encomenda.id_encomenda).filter(Encomenda.id_encomenda == id, Encomenda.removido_em.is_(None)).first():
+        raise HTTPException(status_code=404, detail=f"Encomenda com id {id} não encontrada")
     localizacoes = db.query(Localizacao).filter(Localizacao.id_encomenda == id).all()
     return localizacoes
 
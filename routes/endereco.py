@@ -0,0 +1,92 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session as ORM_Session
+
+from .database import SessionLocal
+from .models import Endereco
+
+# Cache LRU de chave normalizada -> id_endereco, compartilhado entre requisições.
+# Só recebe ids de endereços já confirmados no banco: os cadastrados na
+# transação corrente ficam em `session.info` até o commit.
+CACHE_MAX = 10000
+_cache = OrderedDict()
+_cache_lock = Lock()
+
+def normalizar_endereco(endereco: str) -> str:
+    return " ".join(endereco.split()).casefold()
+
+def _cache_get(chave: str) -> Optional[str]:
+    with _cache_lock:
+        id_endereco = _cache.get(chave)
+        if id_endereco is not None:
+            _cache.move_to_end(chave)
+        return id_endereco
+
+def _cache_put(chave: str, id_endereco: str):
+    with _cache_lock:
+        _cache[chave] = id_endereco
+        _cache.move_to_end(chave)
+        if len(_cache) > CACHE_MAX:
+            _cache.popitem(last=False)
+
+def _novos(db: ORM_Session) -> dict:
+    return db.info.setdefault("enderecos_novos", {})
+
+@event.listens_for(SessionLocal, "after_commit")
+def _publicar_novos(session):
+    for chave, id_endereco in session.info.pop("enderecos_novos", {}).items():
+        _cache_put(chave, id_endereco)
+
+@event.listens_for(SessionLocal, "after_transaction_end")
+def _descartar_novos(session, transaction):
+    # Transação principal terminou sem commit (rollback ou close).
+    if transaction.parent is None:
+        session.info.pop("enderecos_novos", None)
+
+def esquecer_enderecos(*enderecos: str):
+    """
+    Remove endereços do cache, para quando uma escrita que os usou falhar com
+    erro de integridade.
+    """
+    with _cache_lock:
+        for endereco in enderecos:
+            _cache.pop(normalizar_endereco(endereco), None)
+
+def buscar_endereco(db: ORM_Session, endereco: str) -> Optional[str]:
+    """
+    Retorna o id do endereço já cadastrado, ou `None` se ele não existir.
+    """
+    chave = normalizar_endereco(endereco)
+    id_endereco = _novos(db).get(chave) or _cache_get(chave)
+    if id_endereco is None:
+        row = db.query(Endereco.id_endereco).filter(Endereco.chave == chave).first()
+        if row:
+            # Não foi cadastrado nesta transação, então já está confirmado.
+            id_endereco = row.id_endereco
+            _cache_put(chave, id_endereco)
+    return id_endereco
+
+def resolver_endereco(db: ORM_Session, endereco: str) -> str:
+    """
+    Retorna o id do endereço, cadastrando-o se ainda não existir.
+
+    Endereços novos só entram no cache quando a transação que os criou é
+    confirmada; se ela for desfeita, são descartados.
+    """
+    id_endereco = buscar_endereco(db, endereco)
+    if id_endereco is not None:
+        return id_endereco
+
+    chave = normalizar_endereco(endereco)
+    novo = Endereco(chave=chave, endereco=" ".join(endereco.split()))
+    try:
+        with db.begin_nested():
+            db.add(novo)
+    except IntegrityError:
+        # Outra requisição cadastrou o mesmo endereço ao mesmo tempo.
+        return db.query(Endereco.id_endereco).filter(Endereco.chave == chave).with_for_update().one().id_endereco
+    _novos(db)[chave] = novo.id_endereco
+    return novo.id_endereco
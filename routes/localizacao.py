@@ -1,12 +1,18 @@
-from fastapi import Depends, APIRouter, HTTPException, Path, Body
+from fastapi import Depends, APIRouter, HTTPException, Path, Body, Query
 from pydantic import Field
 from datetime import datetime
 from pydantic import BaseModel, Field
+from typing import List, Optional
 from uuid import uuid4
+from sqlalchemy import select, union, or_, and_
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
 from .database import SessionLocal, engine
 from . import models
-from .models import Localizacao
+from .models import Localizacao, Encomenda
+from .relatorio import registrar_evento
+from .endereco import buscar_endereco, resolver_endereco, esquecer_enderecos
+from .encomenda import EncomendaOut
 
 
 router = APIRouter(
@@ -25,6 +31,23 @@ class LocalizacaoOut(BaseModel):
     endereco: str = Field(..., description="Endereço da localização.")
     id_encomenda: str = Field(..., description="ID da encomenda associada à localização.")
 
+    class Config:
+        from_attributes = True
+
+class PaginaOut(BaseModel):
+    antes_data: datetime = Field(..., description="Valor de `antes_data` para a próxima página.")
+    antes_id: str = Field(..., description="Valor de `antes_id` para a próxima página.")
+
+
+class LocalizacoesEnderecoOut(BaseModel):
+    localizacoes: List[LocalizacaoOut] = Field(..., description="Eventos registrados no endereço.")
+    proxima_pagina: Optional[PaginaOut] = Field(None, description="Cursor da próxima página, se houver.")
+
+
+class EncomendasEnderecoOut(BaseModel):
+    encomendas: List[EncomendaOut] = Field(..., description="Encomendas que passaram pelo endereço.")
+    proxima_pagina: Optional[PaginaOut] = Field(None, description="Cursor da próxima página, se houver.")
+
 # Dependency
 def get_db():
     db = SessionLocal()
@@ -33,6 +56,37 @@ def get_db():
     finally:
         db.close()
 
+def _verificar_encomenda(db: Session, id_encomenda: str):
+    # Encomendas removidas logicamente não recebem novos eventos.
+    encomenda = db.query(Encomenda.id_encomenda).filter(
+        Encomenda.id_encomenda == id_encomenda, Encomenda.removido_em.is_(None)
+    ).first()
+    if not encomenda:
+        raise HTTPException(404, detail=f"Encomenda com id {id_encomenda} não encontrada")
+
+def _localizacoes(db: Session):
+    # Eventos de encomendas removidas logicamente ficam ocultos, como elas.
+    return db.query(Localizacao).join(Encomenda, Localizacao.id_encomenda == Encomenda.id_encomenda) \
+        .filter(Encomenda.removido_em.is_(None))
+
+def _verificar_cursor(antes_data: Optional[datetime], antes_id: Optional[str]):
+    if (antes_data is None) != (antes_id is None):
+        raise HTTPException(400, detail="Informe antes_data e antes_id juntos")
+
+def _mais_recentes(filtro, limit: int, antes_data: Optional[datetime], antes_id: Optional[str]):
+    # Ids das `limit` encomendas ativas mais recentes que atendem `filtro`,
+    # depois do cursor. Fica em subconsulta porque nem todo banco aceita
+    # ORDER BY e LIMIT direto em um membro de UNION.
+    query = select(Encomenda.id_encomenda, Encomenda.data_postagem) \
+        .where(filtro, Encomenda.removido_em.is_(None))
+    if antes_data is not None:
+        query = query.where(or_(
+            Encomenda.data_postagem < antes_data,
+            and_(Encomenda.data_postagem == antes_data, Encomenda.id_encomenda < antes_id)
+        ))
+    recentes = query.order_by(Encomenda.data_postagem.desc(), Encomenda.id_encomenda.desc()).limit(limit).subquery()
+    return select(recentes.c.id_encomenda)
+
 @router.post("/", response_model=LocalizacaoOut, summary="Criar Localização")
 def create(localizacaoIn: LocalizacaoIn = Body(
         ...,
@@ -55,22 +109,121 @@ def create(localizacaoIn: LocalizacaoIn = Body(
         }
         ```
     """
-    # encomenda = db.query(models.Encomenda).filter(models.Encomenda.id_encomenda == localizacaoIn.id_encomenda).first()
-    # if not encomenda:
-    #     raise HTTPException(status_code=404, detail=f"Encomenda com id {localizacaoIn.id_encomenda} não encontrada")
+    _verificar_encomenda(db, localizacaoIn.id_encomenda)
 
-    localizacao = models.Localizacao(**localizacaoIn.dict())
-    db.add(localizacao)
-    db.commit()
+    try:
+        localizacao = models.Localizacao(
+            id_endereco=resolver_endereco(db, localizacaoIn.endereco),
+            id_encomenda=localizacaoIn.id_encomenda
+        )
+        db.add(localizacao)
+        db.flush()
+        registrar_evento(db, localizacao)
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        esquecer_enderecos(localizacaoIn.endereco)
+        raise HTTPException(400, detail="Erro ao criar localização: {}".format(e))
     db.refresh(localizacao)
     return localizacao
 
-@router.get("/", summary="Listar Todas as Localizações")
+@router.get("/", response_model=List[LocalizacaoOut], summary="Listar Todas as Localizações")
 def get_all(db: Session = Depends(get_db)):
     """
-    Lista todas as localizações cadastradas.
+    Lista todas as localizações cadastradas, exceto as de encomendas
+    removidas logicamente.
+    """
+    return [LocalizacaoOut.from_orm(localizacao) for localizacao in _localizacoes(db).all()]
+
+@router.get("/endereco/localizacoes", response_model=LocalizacoesEnderecoOut, summary="Listar Localizações do Endereço")
+def get_localizacoes_endereco(endereco: str = Query(..., description="Endereço cujos eventos se deseja obter."),
+                              limit: int = Query(100, ge=1, le=1000, description="Quantidade máxima de eventos retornados."),
+                              antes_data: Optional[datetime] = Query(None, description="`data` do último evento da página anterior."),
+                              antes_id: Optional[str] = Query(None, description="`id_localizacao` do último evento da página anterior."),
+                              db: Session = Depends(get_db)):
+    """
+    Lista os eventos registrados em um endereço, do mais recente para o mais
+    antigo.
+
+    A paginação é por cursor: para obter a próxima página, envie em
+    `antes_data` e `antes_id` os valores de `proxima_pagina` da resposta
+    anterior.
+
+    Parâmetros:
+    - `endereco`: Endereço da localização (a comparação ignora maiúsculas e espaços repetidos).
+        Exemplo:
+        ```
+        "Rua Casa do Ator, 123"
+        ```
+    """
+    _verificar_cursor(antes_data, antes_id)
+    id_endereco = buscar_endereco(db, endereco)
+    if id_endereco is None:
+        return {"localizacoes": [], "proxima_pagina": None}
+
+    query = _localizacoes(db).filter(Localizacao.id_endereco == id_endereco)
+    if antes_data is not None:
+        query = query.filter(or_(
+            Localizacao.data < antes_data,
+            and_(Localizacao.data == antes_data, Localizacao.id_localizacao < antes_id)
+        ))
+    localizacoes = query.order_by(Localizacao.data.desc(), Localizacao.id_localizacao.desc()).limit(limit).all()
+
+    proxima_pagina = None
+    if len(localizacoes) == limit:
+        proxima_pagina = {"antes_data": localizacoes[-1].data, "antes_id": localizacoes[-1].id_localizacao}
+    return {
+        "localizacoes": [LocalizacaoOut.from_orm(localizacao) for localizacao in localizacoes],
+        "proxima_pagina": proxima_pagina
+    }
+
+@router.get("/endereco/encomendas", response_model=EncomendasEnderecoOut, summary="Listar Encomendas do Endereço")
+def get_encomendas_endereco(endereco: str = Query(..., description="Endereço cujas encomendas se deseja obter."),
+                            limit: int = Query(100, ge=1, le=1000, description="Quantidade máxima de encomendas retornadas."),
+                            antes_data: Optional[datetime] = Query(None, description="`data_postagem` da última encomenda da página anterior."),
+                            antes_id: Optional[str] = Query(None, description="`id_encomenda` da última encomenda da página anterior."),
+                            db: Session = Depends(get_db)):
+    """
+    Lista as encomendas que saíram de um endereço, foram para ele ou passaram
+    por ele, da mais recente para a mais antiga.
+
+    A paginação é por cursor: para obter a próxima página, envie em
+    `antes_data` e `antes_id` os valores de `proxima_pagina` da resposta
+    anterior.
+
+    Parâmetros:
+    - `endereco`: Endereço da encomenda (a comparação ignora maiúsculas e espaços repetidos).
+        Exemplo:
+        ```
+        "Rua Casa do Ator, 123"
+        ```
     """
-    return db.query(models.Localizacao).all()
+    _verificar_cursor(antes_data, antes_id)
+    id_endereco = buscar_endereco(db, endereco)
+    if id_endereco is None:
+        return {"encomendas": [], "proxima_pagina": None}
+
+    # Uma consulta por caminho, em vez de um OR que o MySQL resolveria
+    # varrendo `encomendas`. Cada uma lê só as `limit` encomendas mais
+    # recentes do seu índice; a união fica com no máximo 3 * `limit` linhas.
+    caminhos = [
+        Encomenda.id_endereco_origem == id_endereco,
+        Encomenda.id_endereco_destino == id_endereco,
+        select(Localizacao.id_localizacao).where(
+            Localizacao.id_encomenda == Encomenda.id_encomenda, Localizacao.id_endereco == id_endereco
+        ).exists(),
+    ]
+    ids = union(*[_mais_recentes(caminho, limit, antes_data, antes_id) for caminho in caminhos]).subquery()
+    encomendas = db.query(Encomenda).join(ids, Encomenda.id_encomenda == ids.c.id_encomenda) \
+        .order_by(Encomenda.data_postagem.desc(), Encomenda.id_encomenda.desc()).limit(limit).all()
+
+    proxima_pagina = None
+    if len(encomendas) == limit:
+        proxima_pagina = {"antes_data": encomendas[-1].data_postagem, "antes_id": encomendas[-1].id_encomenda}
+    return {
+        "encomendas": [EncomendaOut.from_orm(encomenda) for encomenda in encomendas],
+        "proxima_pagina": proxima_pagina
+    }
 
 @router.get("/{id}", response_model=LocalizacaoOut, summary="Obter Localização")
 def get_unique(id: str = Path(..., description="ID da localização que deseja obter."), db: Session = Depends(get_db)):
@@ -84,7 +237,7 @@ def get_unique(id: str = Path(..., description="ID da localização que deseja o
         "b2a53b2a-5151-4ef7-ae94-c4992dd119ef"
         ```
     """
-    localizacao = db.query(Localizacao).filter(Localizacao.id_localizacao == id).first()
+    localizacao = _localizacoes(db).filter(Localizacao.id_localizacao == id).first()
     if localizacao:
         return localizacao
     raise HTTPException(404, detail=f"Localização com id {id} não encontrada")
@@ -114,13 +267,19 @@ def update(id: str = Path(..., description="ID da localização que deseja atual
             "id_encomenda": "7ee85363-1c9d-4bf8-afd6-645aad61539f"
         }
         """
-    localizacao = db.query(models.Localizacao).filter(models.Localizacao.id_localizacao == id).first()
+    localizacao = _localizacoes(db).filter(Localizacao.id_localizacao == id).first()
     if not localizacao:
         raise HTTPException(404, detail=f"Localização com id {id} não encontrada")
+    _verificar_encomenda(db, localizacaoIn.id_encomenda)
 
-    localizacao.endereco = localizacaoIn.endereco
-    localizacao.id_encomenda = localizacaoIn.id_encomenda
-    db.commit()
+    try:
+        localizacao.id_endereco = resolver_endereco(db, localizacaoIn.endereco)
+        localizacao.id_encomenda = localizacaoIn.id_encomenda
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        esquecer_enderecos(localizacaoIn.endereco)
+        raise HTTPException(400, detail="Erro ao atualizar localização: {}".format(e))
     db.refresh(localizacao)
     return localizacao
 
@@ -135,10 +294,12 @@ def delete(id: str = Path(..., description="ID da localização que deseja delet
         ```
         "b2a53b2a-5151-4ef7-ae94-c4992dd119ef"
         """
-    localizacao = db.query(Localizacao).filter(Localizacao.id_localizacao == id).first()
+    localizacao = _localizacoes(db).filter(Localizacao.id_localizacao == id).first()
     if not localizacao:
         raise HTTPException(404, detail=f"Localização com id {id} não encontrada")
 
     db.delete(localizacao)
+    db.flush()
+    registrar_evento(db, localizacao, -1)
     db.commit()
     return {"message": "Localização removida"}
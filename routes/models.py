@@ -1,4 +1,4 @@
-from sqlalchemy import Table, Column, String, Float, DateTime, ForeignKey
+from sqlalchemy import Table, Column, String, Float, Integer, Date, DateTime, ForeignKey, Index
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import relationship
 from uuid import uuid4
@@ -18,10 +18,13 @@ class Encomenda(Base):
 
     id_encomenda = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     valor_total = Column(Float, default=0.0)
-    data_postagem = Column(DateTime, default=datetime.datetime.now)
-    endereco_origem = Column(String(36))
-    endereco_destino = Column(String(36))
+    data_postagem = Column(DateTime, default=datetime.datetime.now, index=True)
+    id_endereco_origem = Column(String(36), ForeignKey('enderecos.id_endereco'))
+    id_endereco_destino = Column(String(36), ForeignKey('enderecos.id_endereco'))
     peso_total = Column(Float, default=0.0)
+    # Preenchida na remoção lógica (ver `DELETE /encomenda/`); encomendas
+    # removidas logicamente são ignoradas nas consultas até serem excluídas.
+    removido_em = Column(DateTime, nullable=True)
     
     id_usuario_comprador = Column(String(36), ForeignKey('usuarios.id_usuario'))
     id_usuario_vendedor = Column(String(36), ForeignKey('usuarios.id_usuario'))
@@ -29,25 +32,86 @@ class Encomenda(Base):
     comprador = relationship("Usuario", foreign_keys=[id_usuario_comprador])
     vendedor = relationship("Usuario", foreign_keys=[id_usuario_vendedor])
 
+    origem = relationship("Endereco", foreign_keys=[id_endereco_origem], lazy="joined")
+    destino = relationship("Endereco", foreign_keys=[id_endereco_destino], lazy="joined")
+
     produtos = relationship("Produto", secondary=encomenda_produto_association, backref="encomendas")
 
+    # Índices para o histórico de encomendas por usuário (ver
+    # `GET /usuario/{id}/encomendas`): cobrem o filtro por comprador/vendedor
+    # e por `removido_em IS NULL`, a contagem e a paginação por
+    # (data_postagem, id_encomenda).
+    __table_args__ = (
+        Index('ix_encomendas_comprador_ativas', 'id_usuario_comprador', 'removido_em', 'data_postagem', 'id_encomenda'),
+        Index('ix_encomendas_vendedor_ativas', 'id_usuario_vendedor', 'removido_em', 'data_postagem', 'id_encomenda'),
+        # O mesmo para as encomendas por endereço de origem/destino (ver
+        # `GET /localizacao/endereco/encomendas`).
+        Index('ix_encomendas_origem_ativas', 'id_endereco_origem', 'removido_em', 'data_postagem', 'id_encomenda'),
+        Index('ix_encomendas_destino_ativas', 'id_endereco_destino', 'removido_em', 'data_postagem', 'id_encomenda'),
+        # Remoção lógica em lote por data (ver `DELETE /encomenda/`); a
+        # definitiva usa o índice de `data_postagem`.
+        Index('ix_encomendas_removido_data', 'removido_em', 'data_postagem'),
+    )
+
+    @property
+    def endereco_origem(self):
+        return self.origem.endereco if self.origem else None
+
+    @property
+    def endereco_destino(self):
+        return self.destino.endereco if self.destino else None
+
 
 
 class Produto(Base):
     __tablename__ = 'produtos'
 
     id_produto = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    nome = Column(String(36))
+    nome = Column(String(36), index=True)
     peso = Column(Float)
     preco = Column(Float)
 
+    # Índice full-text usado pela busca de produtos. Só é criado no MySQL; nos
+    # demais bancos a busca usa expressão regular e percorre a tabela. O
+    # índice comum em `nome` serve apenas à ordenação dos resultados.
+    __table_args__ = (
+        Index('ix_produtos_nome_fulltext', 'nome', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+    )
+
 class Localizacao(Base):
     __tablename__ = 'localizacoes'
     id_localizacao = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     data = Column(DateTime, default=datetime.datetime.now)
-    endereco = Column(String(36))
+    id_endereco = Column(String(36), ForeignKey('enderecos.id_endereco'))
     
-    id_encomenda = Column(String(36), ForeignKey('encomendas.id_encomenda'))
+    id_encomenda = Column(String(36), ForeignKey('encomendas.id_encomenda', ondelete="CASCADE"))
+
+    local = relationship("Endereco", lazy="joined")
+
+    # Eventos por endereço paginados por (data, id_localizacao) e, na busca
+    # de encomendas por endereço, se uma encomenda passou por ele (ver
+    # `GET /localizacao/endereco/...`).
+    __table_args__ = (
+        Index('ix_localizacoes_endereco_cursor', 'id_endereco', 'data', 'id_localizacao', 'id_encomenda'),
+        Index('ix_localizacoes_encomenda_endereco', 'id_encomenda', 'id_endereco'),
+    )
+
+    @property
+    def endereco(self):
+        return self.local.endereco if self.local else None
+
+
+class Endereco(Base):
+    __tablename__ = 'enderecos'
+
+    # `chave` é o endereço normalizado (ver `routes.endereco`); `endereco` é o
+    # texto como foi recebido na primeira vez. No MySQL `chave` usa collation
+    # binária, para que a igualdade venha só de `normalizar_endereco` (a
+    # padrão ignoraria acentos e juntaria "rua são" e "rua sao").
+    id_endereco = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    chave = Column(String(255).with_variant(String(255, collation="utf8mb4_bin"), "mysql"), unique=True)
+    endereco = Column(String(255))
+
 
 class ProdutoOut(BaseModel):
     id_produto: str
@@ -77,3 +141,19 @@ class Usuario(Base):
     email = Column(String(36))
     senha = Column(String(36))
 
+
+class VendaDiaria(Base):
+    __tablename__ = 'vendas_diarias'
+
+    id_usuario_vendedor = Column(String(36), primary_key=True)
+    dia = Column(Date, primary_key=True)
+    quantidade_encomendas = Column(Integer, default=0)
+    valor_total = Column(Float, default=0.0)
+    peso_total = Column(Float, default=0.0)
+
+
+class EventoDiario(Base):
+    __tablename__ = 'eventos_diarios'
+
+    dia = Column(Date, primary_key=True)
+    quantidade_eventos = Column(Integer, default=0)
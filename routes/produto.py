@@ -1,15 +1,31 @@
-from fastapi import Depends, APIRouter, HTTPException, Path, Body
+from fastapi import Depends, APIRouter, HTTPException, Path, Body, Query
 from pydantic import BaseModel, Field
 from uuid import uuid4
 from sqlalchemy import create_engine, Column, String
+from typing import List, Optional
+import re
 
 from . import models
 from . models import Produto, ProdutoOut
-from .database import SessionLocal, engine
+from .database import SessionLocal, engine, TAMANHO_LOTE
 from sqlalchemy.orm import Session as ORM_Session
 
 models.Base.metadata.create_all(bind=engine)
 
+# Limites padrão do índice full-text do InnoDB (`innodb_ft_min_token_size` e
+# a lista de stopwords padrão): termos assim não estão no índice, então são
+# filtrados por REGEXP em vez de MATCH.
+FT_TAMANHO_MINIMO = 3
+FT_STOPWORDS = frozenset({
+    "a", "about", "an", "are", "as", "at", "be", "by", "com", "de", "en", "for",
+    "from", "how", "i", "in", "is", "it", "la", "of", "on", "or", "that", "the",
+    "this", "to", "was", "what", "when", "where", "who", "will", "with", "und", "www"
+})
+
+def _inicio_de_palavra(termo: str):
+    # O termo precisa iniciar uma palavra; como no InnoDB, `_` faz parte da palavra.
+    return Produto.nome.regexp_match(rf"(?i)(^|\W){termo}")
+
 router = APIRouter(
     prefix="/produto",
     tags=["produto"]
@@ -68,7 +84,55 @@ def get_all(db: ORM_Session = Depends(get_db)):
     Lista todos os produtos cadastrados no sistema.
     """
     return db.query(Produto).all()
-    
+
+@router.get("/search", response_model=List[ProdutoOut], summary="Buscar Produtos")
+def search(q: str = Query("", description="Termos buscados no nome do produto (cada termo casa por prefixo)."),
+           preco_min: Optional[float] = Query(None, description="Preço mínimo."),
+           preco_max: Optional[float] = Query(None, description="Preço máximo."),
+           peso_min: Optional[float] = Query(None, description="Peso mínimo."),
+           peso_max: Optional[float] = Query(None, description="Peso máximo."),
+           limit: int = Query(50, ge=1, le=500, description="Quantidade máxima de produtos retornados."),
+           offset: int = Query(0, ge=0, description="Quantidade de produtos a pular."),
+           db: ORM_Session = Depends(get_db)):
+    """
+    Busca produtos pelo nome, com filtros de preço e peso e paginação.
+
+    Todos os termos de `q` precisam aparecer no nome, casando pelo início de
+    alguma palavra. No MySQL a busca usa o índice full-text de `nome` para os
+    termos que ele indexa; os demais (e, nos outros bancos, todos) são
+    filtrados por expressão regular, o que percorre a tabela.
+
+    Parâmetros:
+    - `q`: Termos da busca.
+        Exemplo:
+        ```
+        "camisa cox"
+        ```
+    """
+    query = db.query(Produto)
+
+    termos = re.findall(r"\w+", q)
+    indexados = []
+    if db.get_bind().dialect.name == "mysql":
+        indexados = [termo for termo in termos
+                     if len(termo) >= FT_TAMANHO_MINIMO and termo.casefold() not in FT_STOPWORDS]
+        if indexados:
+            query = query.filter(Produto.nome.match(" ".join(f"+{termo}*" for termo in indexados)))
+    for termo in termos:
+        if termo not in indexados:
+            query = query.filter(_inicio_de_palavra(termo))
+
+    if preco_min is not None:
+        query = query.filter(Produto.preco >= preco_min)
+    if preco_max is not None:
+        query = query.filter(Produto.preco <= preco_max)
+    if peso_min is not None:
+        query = query.filter(Produto.peso >= peso_min)
+    if peso_max is not None:
+        query = query.filter(Produto.peso <= peso_max)
+
+    produtos = query.order_by(Produto.nome, Produto.id_produto).offset(offset).limit(limit).all()
+    return [ProdutoOut.from_orm(produto) for produto in produtos]
 
 @router.get("/{id}", response_model=ProdutoOut, summary="Obter Produto")
 def get_produto(id_produto: str, db: ORM_Session = Depends(get_db)):
@@ -136,9 +200,27 @@ def delete(id: str = Path(..., description="ID do produto que deseja deletar."),
         ```
         "b2a53b2a-5151-4ef7-ae94-c4992dd119ef"
         """
-    produto = db.query(Produto).filter(Produto.id_produto == id).first()
-    if not produto:
+    removidos = db.query(Produto).filter(Produto.id_produto == id).delete(synchronize_session=False)
+    if not removidos:
         raise HTTPException(404, detail=f"Produto com id {id} não encontrado")
-    db.delete(produto)
     db.commit()
     return {"message": "Produto deletado com sucesso"}
+
+@router.delete("/", summary="Deletar Produtos em Lote")
+def delete_all(ids: List[str] = Body(
+        ...,
+        embed=True,
+        description="IDs dos produtos que deseja deletar.",
+        example=["b2a53b2a-5151-4ef7-ae94-c4992dd119ef"]
+    ), db: ORM_Session = Depends(get_db)):
+    """
+    Remove vários produtos, em lotes de `TAMANHO_LOTE` por transação. Os
+    vínculos em `encomenda_produto` são removidos pelo ON DELETE CASCADE do
+    banco.
+    """
+    total = 0
+    for inicio in range(0, len(ids), TAMANHO_LOTE):
+        total += db.query(Produto).filter(Produto.id_produto.in_(ids[inicio:inicio + TAMANHO_LOTE])) \
+            .delete(synchronize_session=False)
+        db.commit()
+    return {"message": f"{total} produtos deletados"}
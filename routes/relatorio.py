@@ -0,0 +1,226 @@
+from fastapi import Depends, APIRouter, Path, Query
+from pydantic import BaseModel
+from datetime import date
+from typing import List, Optional
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session as ORM_Session
+
+from .database import SessionLocal
+from .models import Encomenda, Localizacao, VendaDiaria, EventoDiario
+
+router = APIRouter(
+    prefix="/relatorios",
+    tags=["relatorios"]
+)
+
+class VendaDiariaOut(BaseModel):
+    id_usuario_vendedor: str
+    dia: date
+    quantidade_encomendas: int
+    valor_total: float
+    peso_total: float
+
+    class Config:
+        from_attributes = True
+
+
+class VendaTotalOut(BaseModel):
+    id_usuario_vendedor: str
+    quantidade_encomendas: int
+    valor_total: float
+    peso_total: float
+
+
+class EventoDiarioOut(BaseModel):
+    dia: date
+    quantidade_eventos: int
+
+    class Config:
+        from_attributes = True
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def _somar(db: ORM_Session, modelo, chave: dict, deltas: dict):
+    """
+    Soma `deltas` à linha de `modelo` identificada por `chave`, criando-a se
+    não existir, em um único upsert atômico (sem ler a linha antes).
+    """
+    tabela = modelo.__table__
+    valores = {**chave, **deltas}
+    dialeto = db.get_bind().dialect.name
+    if dialeto == "mysql":
+        stmt = mysql_insert(tabela).values(**valores)
+        stmt = stmt.on_duplicate_key_update({col: tabela.c[col] + stmt.inserted[col] for col in deltas})
+    elif dialeto in ("postgresql", "sqlite"):
+        stmt = (postgresql_insert if dialeto == "postgresql" else sqlite_insert)(tabela).values(**valores)
+        stmt = stmt.on_conflict_do_update(index_elements=list(chave),
+                                          set_={col: tabela.c[col] + stmt.excluded[col] for col in deltas})
+    else:
+        filtro = [tabela.c[col] == valor for col, valor in chave.items()]
+        resultado = db.execute(update(tabela).where(*filtro).values({col: tabela.c[col] + delta for col, delta in deltas.items()}))
+        if resultado.rowcount:
+            return
+        stmt = insert(tabela).values(**valores)
+    db.execute(stmt)
+
+def ajustar_venda(db: ORM_Session, id_usuario_vendedor: str, dia: date,
+                  quantidade_encomendas: int, valor_total: float, peso_total: float):
+    """
+    Soma os valores informados (que podem ser negativos) ao consolidado do
+    vendedor no dia.
+
+    O upsert mantém a linha do dia bloqueada até o fim da transação, então
+    deve ser a última escrita antes do commit.
+    """
+    _somar(db, VendaDiaria, {"id_usuario_vendedor": id_usuario_vendedor, "dia": dia},
+           {"quantidade_encomendas": quantidade_encomendas, "valor_total": valor_total, "peso_total": peso_total})
+
+def ajustar_eventos(db: ORM_Session, dia: date, quantidade_eventos: int):
+    """
+    Soma `quantidade_eventos` (que pode ser negativa) ao consolidado do dia,
+    nas mesmas condições de `ajustar_venda`.
+    """
+    _somar(db, EventoDiario, {"dia": dia}, {"quantidade_eventos": quantidade_eventos})
+
+def registrar_venda(db: ORM_Session, encomenda: Encomenda, sinal: int = 1):
+    """
+    Soma (`sinal=1`) ou subtrai (`sinal=-1`) a encomenda do consolidado diário
+    do vendedor. Deve ser chamada na mesma transação que altera a encomenda,
+    depois do flush (para que `data_postagem` já esteja preenchida) e logo
+    antes do commit.
+    """
+    ajustar_venda(db, encomenda.id_usuario_vendedor, encomenda.data_postagem.date(), sinal,
+                  sinal * (encomenda.valor_total or 0), sinal * (encomenda.peso_total or 0))
+
+def registrar_evento(db: ORM_Session, localizacao: Localizacao, sinal: int = 1):
+    """
+    Soma ou subtrai um evento de rastreio do consolidado diário, nas mesmas
+    condições de `registrar_venda`.
+    """
+    ajustar_eventos(db, localizacao.data.date(), sinal)
+
+@router.get("/vendas", response_model=List[VendaDiariaOut], summary="Vendas por Vendedor e Dia")
+def get_vendas(id_usuario_vendedor: Optional[str] = Query(None, description="ID do vendedor."),
+               inicio: Optional[date] = Query(None, description="Primeiro dia do período."),
+               fim: Optional[date] = Query(None, description="Último dia do período."),
+               db: ORM_Session = Depends(get_db)):
+    """
+    Lista o consolidado diário de vendas (quantidade de encomendas, valor e
+    peso totais) por vendedor.
+    """
+    query = db.query(VendaDiaria)
+    if id_usuario_vendedor:
+        query = query.filter(VendaDiaria.id_usuario_vendedor == id_usuario_vendedor)
+    if inicio:
+        query = query.filter(VendaDiaria.dia >= inicio)
+    if fim:
+        query = query.filter(VendaDiaria.dia <= fim)
+    return query.order_by(VendaDiaria.dia, VendaDiaria.id_usuario_vendedor).all()
+
+@router.get("/vendas/{id}", response_model=VendaTotalOut, summary="Total de Vendas do Vendedor")
+def get_total_vendas(id: str = Path(..., description="ID do vendedor."),
+                     inicio: Optional[date] = Query(None, description="Primeiro dia do período."),
+                     fim: Optional[date] = Query(None, description="Último dia do período."),
+                     db: ORM_Session = Depends(get_db)):
+    """
+    Soma o consolidado diário de um vendedor no período informado.
+
+    Parâmetros:
+    - `id`: ID do vendedor.
+        Exemplo:
+        ```
+        "13cc3687-050a-4e0f-8f46-3fe63aa6e5db"
+        ```
+    """
+    query = db.query(
+        func.coalesce(func.sum(VendaDiaria.quantidade_encomendas), 0),
+        func.coalesce(func.sum(VendaDiaria.valor_total), 0.0),
+        func.coalesce(func.sum(VendaDiaria.peso_total), 0.0)
+    ).filter(VendaDiaria.id_usuario_vendedor == id)
+    if inicio:
+        query = query.filter(VendaDiaria.dia >= inicio)
+    if fim:
+        query = query.filter(VendaDiaria.dia <= fim)
+    quantidade_encomendas, valor_total, peso_total = query.one()
+    return VendaTotalOut(
+        id_usuario_vendedor=id,
+        quantidade_encomendas=quantidade_encomendas,
+        valor_total=valor_total,
+        peso_total=peso_total
+    )
+
+@router.get("/eventos", response_model=List[EventoDiarioOut], summary="Eventos de Rastreio por Dia")
+def get_eventos(inicio: Optional[date] = Query(None, description="Primeiro dia do período."),
+                fim: Optional[date] = Query(None, description="Último dia do período."),
+                db: ORM_Session = Depends(get_db)):
+    """
+    Lista a quantidade de eventos de localização registrados por dia.
+    """
+    query = db.query(EventoDiario)
+    if inicio:
+        query = query.filter(EventoDiario.dia >= inicio)
+    if fim:
+        query = query.filter(EventoDiario.dia <= fim)
+    return query.order_by(EventoDiario.dia).all()
+
+def recalcular_consolidados(db: ORM_Session):
+    """
+    Refaz `vendas_diarias` e `eventos_diarios` a partir de `encomendas` e
+    `localizacoes`, em uma única transação.
+    """
+    dia_venda = func.date(Encomenda.data_postagem)
+    vendas = select(
+        Encomenda.id_usuario_vendedor,
+        dia_venda,
+        func.count(Encomenda.id_encomenda),
+        func.coalesce(func.sum(Encomenda.valor_total), 0.0),
+        func.coalesce(func.sum(Encomenda.peso_total), 0.0)
+    ).where(
+        Encomenda.id_usuario_vendedor.isnot(None),
+        Encomenda.removido_em.is_(None)
+    ).group_by(Encomenda.id_usuario_vendedor, dia_venda)
+
+    dia_evento = func.date(Localizacao.data)
+    eventos = select(dia_evento, func.count(Localizacao.id_localizacao)).group_by(dia_evento)
+
+    db.query(VendaDiaria).delete(synchronize_session=False)
+    db.query(EventoDiario).delete(synchronize_session=False)
+    db.execute(insert(VendaDiaria).from_select(
+        ["id_usuario_vendedor", "dia", "quantidade_encomendas", "valor_total", "peso_total"], vendas
+    ))
+    db.execute(insert(EventoDiario).from_select(["dia", "quantidade_eventos"], eventos))
+    db.commit()
+
+def semear_consolidados():
+    """
+    Preenche os consolidados se eles ainda estiverem vazios. É chamada por
+    `migracao.py`, que deve rodar antes da API subir em um banco com
+    encomendas anteriores aos consolidados.
+
+    Sem isso, alterar ou remover essas encomendas subtrairia de linhas que
+    nunca foram somadas, gerando totais negativos.
+    """
+    db = SessionLocal()
+    try:
+        if db.query(VendaDiaria).first() is None and db.query(EventoDiario).first() is None:
+            recalcular_consolidados(db)
+    finally:
+        db.close()
+
+@router.post("/compactar", summary="Recalcular Consolidados")
+def compactar(db: ORM_Session = Depends(get_db)):
+    """
+    Recalcula os consolidados diários a partir de `encomendas` e
+    `localizacoes`. Os consolidados já são atualizados a cada escrita; esta
+    rota serve para um job periódico corrigir eventuais divergências.
+    """
+    recalcular_consolidados(db)
+    return {"message": "Consolidados recalculados"}
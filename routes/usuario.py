@@ -1,12 +1,17 @@
-from fastapi import Depends, APIRouter, HTTPException, Path, Body
+from fastapi import Depends, APIRouter, HTTPException, Path, Body, Query
 from pydantic import BaseModel, Field
 from uuid import uuid4
-from sqlalchemy import create_engine, Column, String
+from datetime import datetime
+from enum import Enum
+from typing import List, Optional
+from sqlalchemy import create_engine, Column, String, or_, and_, func
+from sqlalchemy.exc import IntegrityError
 
 from . import models
-from . models import Usuario
+from . models import Usuario, Encomenda
+from .encomenda import EncomendaOut
 
-from .database import SessionLocal, engine
+from .database import SessionLocal, engine, TAMANHO_LOTE
 from sqlalchemy.orm import Session as ORM_Session
 
 models.Base.metadata.create_all(bind=engine)
@@ -27,6 +32,10 @@ class UsuarioOut(BaseModel):
     nome: str = Field(description="Nome do usuário.")
     email: str = Field(description="E-mail do usuário.")
 
+class Papel(str, Enum):
+    comprador = "comprador"
+    vendedor = "vendedor"
+
 def get_db():
     db = SessionLocal()
     try:
@@ -138,9 +147,85 @@ def delete(id: str = Path(..., description="ID do usuário que deseja deletar.")
         ```
         "b2a53b2a-5151-4ef7-ae94-c4992dd119ef"
         """
-    usuario = db.query(Usuario).filter(Usuario.id_usuario == id).first()
-    if usuario:
-        db.delete(usuario)
+    try:
+        removidos = db.query(Usuario).filter(Usuario.id_usuario == id).delete(synchronize_session=False)
         db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(400, detail=f"Usuário com id {id} possui encomendas")
+    if removidos:
         return {"message": "Usuário removido"}
     raise HTTPException(404, detail=f"Usuário com id {id} não encontrado")
+
+@router.delete("/", summary="Deletar Usuários em Lote")
+def delete_all(ids: List[str] = Body(
+        ...,
+        embed=True,
+        description="IDs dos usuários que deseja deletar.",
+        example=["b2a53b2a-5151-4ef7-ae94-c4992dd119ef"]
+    ), db: ORM_Session = Depends(get_db)):
+    """
+    Remove vários usuários, em lotes de `TAMANHO_LOTE` por transação.
+
+    Usuários que ainda possuem encomendas não podem ser removidos; nesse caso
+    o lote com erro é desfeito e os lotes anteriores permanecem removidos.
+    """
+    total = 0
+    for inicio in range(0, len(ids), TAMANHO_LOTE):
+        try:
+            total += db.query(Usuario).filter(Usuario.id_usuario.in_(ids[inicio:inicio + TAMANHO_LOTE])) \
+                .delete(synchronize_session=False)
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            raise HTTPException(400, detail=f"Há usuários com encomendas no lote; {total} usuários removidos")
+    return {"message": f"{total} usuários removidos"}
+
+@router.get("/{id}/encomendas", summary="Listar Encomendas do Usuário")
+def get_encomendas(id: str = Path(..., description="ID do usuário."),
+                   papel: Papel = Query(Papel.comprador, description="Se o usuário é o comprador ou o vendedor das encomendas."),
+                   limit: int = Query(50, ge=1, le=500, description="Quantidade máxima de encomendas retornadas."),
+                   antes_data: Optional[datetime] = Query(None, description="`data_postagem` da última encomenda da página anterior."),
+                   antes_id: Optional[str] = Query(None, description="`id_encomenda` da última encomenda da página anterior."),
+                   contar: bool = Query(False, description="Retorna apenas a quantidade de encomendas."),
+                   db: ORM_Session = Depends(get_db)):
+    """
+    Lista as encomendas compradas ou vendidas por um usuário, da mais recente
+    para a mais antiga.
+
+    A paginação é por cursor: para obter a próxima página, envie em
+    `antes_data` e `antes_id` os valores de `proxima_pagina` da resposta
+    anterior.
+
+    Parâmetros:
+    - `id`: ID do usuário.
+        Exemplo:
+        ```
+        "b2a53b2a-5151-4ef7-ae94-c4992dd119ef"
+        ```
+    """
+    if not db.query(Usuario.id_usuario).filter(Usuario.id_usuario == id).first():
+        raise HTTPException(404, detail=f"Usuário com id {id} não encontrado")
+    if (antes_data is None) != (antes_id is None):
+        raise HTTPException(400, detail="Informe antes_data e antes_id juntos")
+
+    coluna = Encomenda.id_usuario_comprador if papel == Papel.comprador else Encomenda.id_usuario_vendedor
+    query = db.query(Encomenda).filter(coluna == id, Encomenda.removido_em.is_(None))
+
+    if contar:
+        return {"total": query.with_entities(func.count(Encomenda.id_encomenda)).scalar()}
+
+    if antes_data is not None:
+        query = query.filter(or_(
+            Encomenda.data_postagem < antes_data,
+            and_(Encomenda.data_postagem == antes_data, Encomenda.id_encomenda < antes_id)
+        ))
+    encomendas = query.order_by(Encomenda.data_postagem.desc(), Encomenda.id_encomenda.desc()).limit(limit).all()
+
+    proxima_pagina = None
+    if len(encomendas) == limit:
+        proxima_pagina = {"antes_data": encomendas[-1].data_postagem, "antes_id": encomendas[-1].id_encomenda}
+    return {
+        "encomendas": [EncomendaOut.from_orm(encomenda) for encomenda in encomendas],
+        "proxima_pagina": proxima_pagina
+    }